@@ -77,6 +77,7 @@ from .image import grid_reshape
 from .image import grid_resize
 from .image import grid_sample
 from .image import grid_sample_mask
+from .image import grid_sample_shift
 from .image import image_slice
 from .image import normalize_image
 from .image import rand_sample
@@ -217,6 +218,7 @@ __all__ = (
     "grid_resize",
     "grid_sample",
     "grid_sample_mask",
+    "grid_sample_shift",
     "jacobian_det",
     "jacobian_dict",
     "jacobian_matrix",
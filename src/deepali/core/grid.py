@@ -64,6 +64,8 @@ class Axes(Enum):
     @classmethod
     def from_arg(cls, arg: Union[Axes, str, None]) -> Axes:
         r"""Create enumeration value from function argument."""
+        if isinstance(arg, cls):
+            return arg
         if arg is None or arg == "default":
             return cls.CUBE_CORNERS if ALIGN_CORNERS else cls.CUBE
         return cls(arg)
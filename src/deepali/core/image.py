@@ -1167,6 +1167,90 @@ def grid_sample_mask(
     )
 
 
+def grid_sample_shift(
+    data: Tensor,
+    offset: Tensor,
+    padding: Optional[Union[PaddingMode, str, Scalar]] = None,
+    align_corners: bool = ALIGN_CORNERS,
+) -> Tensor:
+    r"""Sample data at grid points uniformly shifted by a given offset using linear interpolation.
+
+    This function produces the same output as :func:`grid_sample` with ``mode="linear"`` when the
+    ``grid`` points are the undeformed image grid points translated by ``offset``. Instead of a
+    random gather at each sampling point, the image is shifted separately along each spatial
+    dimension by blending two sliced views of the padded input.
+
+    Args:
+        data: Image batch tensor of shape ``(N, C, ..., X)``.
+        offset: Translation of grid points as tensor of shape ``(D,)`` or ``(1, D)``, where coordinates
+            are with respect to ``Axes.CUBE`` or ``Axes.CUBE_CORNERS`` (cf. ``align_corners``)
+            and in the order ``(x, ...)``.
+        padding: Image extrapolation mode or constant by which to pad input ``data``.
+            Supported modes are "border", "constant", and "zeros".
+        align_corners: Whether ``offset`` is with respect to ``Axes.CUBE_CORNERS`` (``True``)
+            or ``Axes.CUBE`` (``False``).
+
+    Returns:
+        Image batch tensor of sampled data with same shape as ``data``.
+
+    """
+    if not isinstance(data, Tensor):
+        raise TypeError("grid_sample_shift() 'data' must be torch.Tensor")
+    if data.ndim < 3:
+        raise ValueError("grid_sample_shift() 'data' must have shape (N, C, ..., X)")
+    if not isinstance(offset, Tensor):
+        raise TypeError("grid_sample_shift() 'offset' must be torch.Tensor")
+    D = data.ndim - 2
+    if offset.ndim == 2 and offset.shape[0] == 1:
+        offset = offset[0]
+    if offset.shape != (D,):
+        raise ValueError(f"grid_sample_shift() 'offset' must be tensor of shape ({D},) or (1, {D})")
+    if isinstance(padding, (PaddingMode, str)):
+        padding_mode = PaddingMode.from_arg(padding)
+        padding_value = 0.0
+    else:
+        padding_mode = PaddingMode.CONSTANT
+        padding_value = float(padding or 0)
+    if padding_mode not in (PaddingMode.BORDER, PaddingMode.CONSTANT, PaddingMode.ZEROS):
+        raise ValueError(
+            f"grid_sample_shift() does not support padding mode '{padding_mode.value}'"
+        )
+    out = data if data.is_floating_point() else data.float()
+    offset = offset.to(device=data.device, dtype=out.dtype)
+    for i in range(D):
+        dim = data.ndim - 1 - i
+        n = data.shape[dim]
+        # Shift in voxel units
+        if align_corners:
+            shift = offset[i] * ((n - 1) / 2)
+        else:
+            shift = offset[i] * (n / 2)
+        k = math.floor(float(shift.detach()))
+        k = min(max(k, -n - 1), n)  # beyond this, all sampled values are padded
+        w = shift - k
+        before = max(0, -k)
+        after = max(0, k + 1)
+        if padding_mode is PaddingMode.BORDER:
+            shape = list(out.shape)
+            shape[dim] = before
+            head = out.narrow(dim, 0, 1).expand(shape)
+            shape[dim] = after
+            tail = out.narrow(dim, n - 1, 1).expand(shape)
+        else:
+            shape = list(out.shape)
+            shape[dim] = before
+            head = out.new_full(shape, padding_value)
+            shape[dim] = after
+            tail = out.new_full(shape, padding_value)
+        padded = torch.cat([head, out, tail], dim=dim)
+        a = padded.narrow(dim, before + k, n)
+        b = padded.narrow(dim, before + k + 1, n)
+        out = torch.lerp(a, b, w)
+    if data.is_floating_point():
+        out = out.type_as(data)
+    return out
+
+
 def rand_sample(
     data: Union[Tensor, Sequence[Tensor]],
     num_samples: int,
@@ -189,10 +189,12 @@ def homogeneous_transform(transform: Tensor, points: Tensor, vectors: bool = Fal
     if transform.shape[2] == 1:
         if not vectors:
             points = points + transform[..., 0].unsqueeze(1)
-    else:
+    elif vectors or transform.shape[2] == D:
         points = torch.bmm(points, transform[:, :D, :D].transpose(1, 2))
-        if not vectors and transform.shape[2] == D + 1:
-            points += transform[..., D].unsqueeze(1)
+    else:
+        # Add translation as part of batched matrix-matrix product
+        offset = transform[..., D].unsqueeze(1)
+        points = torch.baddbmm(offset, points, transform[:, :D, :D].transpose(1, 2))
     return points.reshape(output_shape)
 
 
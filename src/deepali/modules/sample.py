@@ -1,7 +1,8 @@
 r"""Modules for sampling of image data, e.g., after spatial transformation."""
 
-from typing import Dict, Mapping, Optional, Tuple, Union, cast, overload
+from typing import Dict, Mapping, Optional, Tuple, Union, overload
 
+import torch
 from torch import Tensor
 from torch.nn import Module
 
@@ -15,6 +16,8 @@ from deepali.core.typing import Scalar
 class SampleImage(Module):
     r"""Sample images at grid points."""
 
+    matrix: Tensor
+
     def __init__(
         self,
         target: Grid,
@@ -99,9 +102,27 @@ class SampleImage(Module):
             matrix = homogeneous_matmul(matrix, offset)
         return matrix.unsqueeze(0)
 
-    def _transform_target_to_source(self, grid: Tensor) -> Tensor:
-        r"""Transform target grid points to source cube."""
-        matrix = cast(Tensor, self.matrix)
+    def _transform_target_to_source(
+        self, grid: Tensor, flip_coords: bool = False, transform: Optional[Tensor] = None
+    ) -> Tensor:
+        r"""Transform target grid points to source cube.
+
+        Args:
+            grid: Target grid points.
+            flip_coords: Whether ``grid`` point coordinates are in flipped order (z, y, x).
+                The reordering is folded into the columns of the homogeneous target to source matrix,
+                such that no flipped copy of the ``grid`` tensor is made.
+            transform: Linear transformation of ``grid`` points to apply before mapping them to the
+                source cube. It is composed with the target to source matrix, such that the ``grid``
+                points are transformed by a single homogeneous coordinate transformation.
+
+        """
+        matrix = self.matrix
+        if flip_coords:
+            D = grid.shape[-1]
+            matrix = torch.cat([matrix[..., :D].flip((-1,)), matrix[..., D:]], dim=-1)
+        if transform is not None:
+            matrix = homogeneous_matmul(matrix, transform)
         return homogeneous_transform(matrix, grid)
 
     def _sample_source_image(
@@ -203,11 +224,31 @@ class SampleImage(Module):
         input: Optional[Union[Tensor, Dict[str, Tensor]]] = None,
         data: Optional[Tensor] = None,
         mask: Optional[Tensor] = None,
+        flip_coords: bool = False,
+        transform: Optional[Tensor] = None,
     ) -> Union[Tensor, Tuple[Tensor, Tensor], Dict[str, Tensor]]:
-        r"""Sample images at target grid points after mapping these to the source grid cube."""
+        r"""Sample images at target grid points after mapping these to the source grid cube.
+
+        Args:
+            grid: Target grid points.
+            input: Image tensor or dictionary of image tensors to sample.
+            data: Image tensor to sample. Mutually exclusive with tensor ``input``.
+            mask: Image mask to sample.
+            flip_coords: Whether ``grid`` point coordinates are in flipped order (z, y, x).
+            transform: Optional batch of homogeneous coordinate transformations of shape ``(N, D, 1)``,
+                ``(N, D, D)``, or ``(N, D, D + 1)`` by which to transform the target ``grid`` points.
+
+        """
         if grid.ndim == grid.shape[-1] + 1:
             grid = grid.unsqueeze(0)
-        grid = self._transform_target_to_source(grid)
+        if transform is not None:
+            if not isinstance(transform, Tensor):
+                raise TypeError(f"{type(self).__name__}() 'transform' must be Tensor")
+            if transform.ndim != 3:
+                raise ValueError(
+                    f"{type(self).__name__}() 'transform' must be 3-dimensional tensor"
+                )
+        grid = self._transform_target_to_source(grid, flip_coords=flip_coords, transform=transform)
         return self._sample_source_image(grid, input=input, data=data, mask=mask)
 
     def extra_repr(self) -> str:
@@ -229,6 +270,8 @@ class TransformImage(SampleImage):
 
     """
 
+    grid: Tensor
+
     def __init__(
         self,
         target: Grid,
@@ -274,7 +317,7 @@ class TransformImage(SampleImage):
         mask: Optional[Tensor] = None,
     ) -> Union[Tensor, Tuple[Tensor, Tensor], Dict[str, Tensor]]:
         r"""Sample images at transformed target grid points after mapping these to the source grid cube."""
-        grid = cast(Tensor, self.grid)
+        grid = self.grid
         if isinstance(transform, Tensor):
             if transform.ndim == grid.shape[-1] + 1:
                 transform = transform.unsqueeze(0)
@@ -293,6 +336,8 @@ class AlignImage(SampleImage):
 
     """
 
+    grid: Tensor
+
     def __init__(
         self,
         target: Grid,
@@ -338,13 +383,13 @@ class AlignImage(SampleImage):
         mask: Optional[Tensor] = None,
     ) -> Union[Tensor, Tuple[Tensor, Tensor], Dict[str, Tensor]]:
         r"""Sample batch of optionally masked images at linearly transformed target grid points."""
-        composite_transform = cast(Tensor, self.matrix)
+        composite_transform = self.matrix
         if transform is not None:
             if not isinstance(transform, Tensor):
                 raise TypeError("AlignImage() 'transform' must be Tensor")
             if transform.ndim != 3:
                 raise ValueError("AlignImage() 'transform' must be 3-dimensional tensor")
             composite_transform = homogeneous_matmul(composite_transform, transform)
-        grid = cast(Tensor, self.grid)
+        grid = self.grid
         grid = homogeneous_transform(composite_transform, grid)
         return self._sample_source_image(grid, input=input, data=data, mask=mask)
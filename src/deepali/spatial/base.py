@@ -157,6 +157,24 @@ class SpatialTransform(DeviceProperty, Module, metaclass=ABCMeta):
         r"""Whether this transformation is non-rigid."""
         return not self.linear
 
+    def is_uniform_shift(self) -> Optional[Tensor]:
+        r"""Get translation offset if this transformation shifts all points by the same vector.
+
+        This function does not invoke :meth:`.SpatialTransform.update`. It must be called beforehand
+        when the transformation has an internal state which depends on its current parameters.
+
+        Returns:
+            Tensor of shape ``(N, D)`` with translation offsets with respect to the unit cube axes
+            defined by ``self.axes()`` if this is a translation-only transformation, and ``None`` otherwise.
+
+        """
+        if not self.linear:
+            return None
+        transform = self.tensor()
+        if transform.ndim != 3 or transform.shape[2] != 1:
+            return None
+        return transform[..., 0]
+
     def fit(self: TSpatialTransform, flow: FlowFields, **kwargs) -> TSpatialTransform:
         r"""Fit transformation to a given flow field.
 
@@ -7,15 +7,24 @@ and maps these to new spatial locations, to a given input data tensor.
 
 from __future__ import annotations
 
+from contextlib import contextmanager
 from copy import copy as shallow_copy
-from typing import Dict, Optional, Tuple, TypeVar, Union, overload
+import itertools
+from threading import RLock
+from typing import Dict, Generator, Hashable, Optional, Sequence, Tuple, TypeVar, Union, overload
+from weakref import WeakValueDictionary
 
+from pkg_resources import parse_version
+
+import torch
 from torch import Tensor
 from torch.nn import Module
 
+from deepali.core import functional as U
 from deepali.core.enum import PaddingMode, Sampling
-from deepali.core.grid import Axes, Grid
-from deepali.core.typing import Scalar
+from deepali.core.grid import Axes, Grid, grid_points_transform
+from deepali.core.linalg import homogeneous_matmul, homogeneous_transform
+from deepali.core.typing import Device, Scalar
 from deepali.modules import SampleImage
 
 from .base import SpatialTransform
@@ -24,6 +33,108 @@ from .base import SpatialTransform
 TSpatialTransformer = TypeVar("TSpatialTransformer", bound="SpatialTransformer")
 
 
+# Undeformed target grid points of image transformers, which are shared by all
+# image transformers with the same target and spatial transform grid domains.
+_GRID_COORDS_CACHE: WeakValueDictionary[Hashable, Tensor] = WeakValueDictionary()
+
+
+def _grid_key(grid: Grid) -> Hashable:
+    r"""Get hashable key which identifies the attributes of a sampling grid."""
+    return (
+        tuple(grid.size()),
+        tuple(grid.center().tolist()),
+        tuple(grid.spacing().tolist()),
+        tuple(grid.direction().flatten().tolist()),
+        grid.align_corners(),
+    )
+
+
+def _grid_coords(
+    target: Grid, transform: SpatialTransform, flip_coords: bool, device: Device
+) -> Tensor:
+    r"""Get tensor of ``target`` grid points with respect to cube of ``transform.grid()``."""
+    x = target.coords(align_corners=transform.align_corners(), flip=flip_coords, device=device)
+    x = target.transform_points(x, axes=transform.axes(), to_grid=transform.grid())
+    return x.unsqueeze(0)
+
+
+def _cached_grid_coords(
+    target: Grid, transform: SpatialTransform, flip_coords: bool, device: Device
+) -> Tensor:
+    r"""Get shared tensor of ``target`` grid points with respect to cube of ``transform.grid()``.
+
+    The returned tensor may be referenced by other image transformers and must not be modified in-place.
+    Tensors created in inference mode are not shared, because these cannot be saved for backward.
+
+    """
+    if torch.is_inference_mode_enabled():
+        return _grid_coords(target, transform, flip_coords, device)
+    key = (
+        _grid_key(target),
+        _grid_key(transform.grid()),
+        transform.align_corners(),
+        bool(flip_coords),
+        target.dtype,
+        torch.device(device),
+    )
+    coords = _GRID_COORDS_CACHE.get(key)
+    if coords is None:
+        coords = _grid_coords(target, transform, flip_coords, device)
+        _GRID_COORDS_CACHE[key] = coords
+    return coords
+
+
+# Names of global module hooks registered via torch.nn.modules.module.register_module_*_hook()
+_GLOBAL_MODULE_HOOKS = (
+    "_global_forward_hooks",
+    "_global_forward_pre_hooks",
+    "_global_backward_hooks",
+    "_global_backward_pre_hooks",
+)
+
+
+def _has_only_update_hook(transform: SpatialTransform) -> bool:
+    r"""Whether no other module hooks than the :meth:`.SpatialTransform.update` hook are registered."""
+    # Not all global hook dictionaries exist in older torch versions
+    if any(getattr(torch.nn.modules.module, name, None) for name in _GLOBAL_MODULE_HOOKS):
+        return False
+    if transform._forward_hooks:
+        return False
+    # Module._backward_pre_hooks was added in torch 2.0
+    if transform._backward_hooks or getattr(transform, "_backward_pre_hooks", None):
+        return False
+    pre_hooks = transform._forward_pre_hooks
+    handle = transform._update_hook_handle
+    if handle is None:
+        return not pre_hooks
+    return len(pre_hooks) == 1 and handle.id in pre_hooks
+
+
+# Lock which serializes temporary changes of the process-wide float32 matmul precision setting
+_FLOAT32_MATMUL_PRECISION_LOCK = RLock()
+
+
+@contextmanager
+def _float32_matmul_precision(precision: Optional[str]) -> Generator[None, None, None]:
+    r"""Temporarily set internal precision of float32 matrix multiplications.
+
+    The precision is a global setting. Concurrent uses of this context are therefore serialized,
+    such that each restores the setting that was in effect before. Other threads which perform
+    matrix multiplications meanwhile are nevertheless affected by the temporary setting.
+
+    """
+    if precision is None:
+        yield
+        return
+    with _FLOAT32_MATMUL_PRECISION_LOCK:
+        prev_precision = torch.get_float32_matmul_precision()
+        torch.set_float32_matmul_precision(precision)
+        try:
+            yield
+        finally:
+            torch.set_float32_matmul_precision(prev_precision)
+
+
 class SpatialTransformer(Module):
     r"""Spatially transform input data.
 
@@ -54,6 +165,24 @@ class SpatialTransformer(Module):
         super().__init__()
         self._transform = transform
 
+    def __copy__(self: TSpatialTransformer) -> TSpatialTransformer:
+        r"""Make shallow copy of this spatial transformer.
+
+        The copy shares containers for parameters and hooks with this module, but not containers of
+        buffers and modules (cf. :meth:`.SpatialTransform.__copy__`). Unlike ``copy.copy()`` of a
+        ``torch.nn.Module``, this does not go through the generic pickle protocol.
+
+        Returns:
+            Shallow copy of this spatial transformer module.
+
+        """
+        copy = self.__new__(type(self))
+        copy.__dict__ = self.__dict__.copy()
+        for name in ("_buffers", "_non_persistent_buffers_set", "_modules"):
+            if name in self.__dict__:
+                copy.__dict__[name] = self.__dict__[name].copy()
+        return copy
+
     @property
     def transform(self) -> SpatialTransform:
         r"""Spatial grid transformation."""
@@ -80,7 +209,9 @@ class SpatialTransformer(Module):
     ) -> Union[TSpatialTransformer, Tuple[tuple, dict]]:
         r"""Get or set data tensors and parameters on which transformation is conditioned."""
         if args:
-            return shallow_copy(self).condition_(*args)
+            copy = shallow_copy(self)
+            copy._transform = self._transform.condition(*args, **kwargs)
+            return copy
         return self._transform.condition()
 
     def condition_(self: TSpatialTransformer, *args, **kwargs) -> TSpatialTransformer:
@@ -108,8 +239,19 @@ class ImageTransformer(SpatialTransformer):
     the spatial transform when evaluating it. This in particular includes the forward pre-hook
     that invokes :meth:`.SpatialTransform.update` (cf. :class:`.SpatialTransformer`).
 
+    When the spatial transform is a uniform translation (cf. :meth:`.SpatialTransform.is_uniform_shift`),
+    the ``target`` and ``source`` grids are identical to the grid of the spatial transform, and images
+    are sampled using linear interpolation, the input image is shifted by :func:`.grid_sample_shift`
+    instead of sampling it at transformed grid points. In this case, no other module hooks than the
+    update hook may be registered with the spatial transform, and its :meth:`.SpatialTransform.update`
+    function is invoked directly. The same applies when the spatial transform is linear, in which
+    case its homogeneous coordinate transformation is composed with the linear transformation from
+    target to source domain, such that the target grid points are mapped by a single matrix product.
+
     """
 
+    grid_coords: Tensor
+
     def __init__(
         self,
         transform: SpatialTransform,
@@ -119,6 +261,11 @@ class ImageTransformer(SpatialTransformer):
         padding: Union[PaddingMode, str, Scalar] = PaddingMode.BORDER,
         align_centers: bool = False,
         flip_coords: bool = False,
+        precision: Optional[str] = None,
+        batch_inner: bool = False,
+        quantize_coords: bool = False,
+        tile_size: Optional[Union[int, Sequence[int]]] = None,
+        memory_format: Optional[torch.memory_format] = None,
     ) -> None:
         r"""Initialize spatial image transformer.
 
@@ -141,9 +288,51 @@ class ImageTransformer(SpatialTransformer):
                 translation of grid center points is considered.
             flip_coords: Whether spatial transformation applies to flipped grid point coordinates
                 in the order (z, y, x). The default is grid point coordinates in the order (x, y, z).
+            precision: Internal precision of float32 matrix multiplications used to transform the
+                target grid points, i.e., "highest", "high", or "medium". When "high" or "medium",
+                TensorFloat32 or bfloat16 tensor cores may be used by CUDA devices which support them
+                (cf. ``torch.set_float32_matmul_precision()``). If ``None``, the global setting is used.
+                Note that this option temporarily changes the process-wide setting in each forward pass,
+                which is thus not thread-safe with respect to other code that performs float32 matrix
+                multiplications concurrently. Forward passes of image transformers with this option,
+                e.g., of ``torch.nn.DataParallel`` replicas, wait for each other while it is in effect.
+            batch_inner: Whether to sample a batch of images which are transformed by the same spatial
+                transformation with a single ``grid_sample()`` call, where the batch dimension is folded
+                into the channel dimension. The sampling point coordinates are thereby only computed once
+                for all images in the batch, which may be faster on GPU for large batch sizes. On CPU,
+                this is usually slower than sampling each image separately.
+            quantize_coords: Whether to store the undeformed target grid point coordinates as 16-bit
+                integers with a common scaling factor instead of floating point values. This reduces
+                the memory used by the ``grid_coords`` buffer by a factor of two (``float32``) or four
+                (``float64``). The coordinates are converted back to floating point values in each
+                forward pass. The absolute error of normalized coordinates is at most ``1.6e-5``
+                when the ``target`` grid domain is within the domain of the spatial transform.
+            tile_size: Size of target grid tiles in the order ``(nx, ...)``. When given, the spatial
+                transform is applied to each tile of target grid points separately, and the input image
+                is sampled at these transformed points to fill the corresponding tile of the output image.
+                This bounds the size of intermediate tensors and the working set of each step when
+                large images are transformed. It only applies to single image tensors without mask.
+                When no other module hooks than the update hook are registered with the spatial
+                transform, its :meth:`.SpatialTransform.update` function is called once for all tiles.
+                Tiles are only used when the spatial transform is linear, or when its grid is equal to
+                the ``target`` grid. Otherwise, the displacements of a non-rigid transformation would be
+                sampled at the grid points of each tile instead of being resized to the ``target`` grid
+                (cf. ``transform_grid()``), and the whole ``target`` grid is transformed at once instead.
+            memory_format: Memory format of image tensors passed to ``grid_sample()``, i.e., either
+                ``torch.channels_last`` (2D) or ``torch.channels_last_3d`` (3D). Input image tensors
+                are converted to this format unless they are already stored in it. If ``None``,
+                images are sampled in the memory format in which they are given. The ``grid_coords``
+                are always stored with the spatial dimension of point coordinates innermost.
 
         """
         super().__init__(transform)
+        if precision is not None:
+            if precision not in ("highest", "high", "medium"):
+                raise ValueError(
+                    f"{type(self).__name__}() 'precision' must be 'highest', 'high', or 'medium'"
+                )
+            if parse_version(torch.__version__) < parse_version("1.12"):
+                raise RuntimeError(f"{type(self).__name__}() 'precision' requires torch>=1.12")
         if target is None:
             target = transform.grid()
         if source is None:
@@ -152,6 +341,21 @@ class ImageTransformer(SpatialTransformer):
             raise TypeError(f"{type(self).__name__}() 'target' must be of type Grid")
         if not isinstance(source, Grid):
             raise TypeError(f"{type(self).__name__}() 'source' must be of type Grid")
+        if tile_size is not None:
+            if isinstance(tile_size, int):
+                tile_size = (tile_size,) * target.ndim
+            tile_size = tuple(int(n) for n in tile_size)
+            if len(tile_size) != target.ndim or any(n < 1 for n in tile_size):
+                raise ValueError(
+                    f"{type(self).__name__}() 'tile_size' must be positive int or {target.ndim}-tuple"
+                )
+        if memory_format is not None:
+            memory_formats = {2: torch.channels_last, 3: torch.channels_last_3d}
+            if memory_format is not memory_formats.get(target.ndim):
+                raise ValueError(
+                    f"{type(self).__name__}() 'memory_format' must be torch.channels_last (2D)"
+                    " or torch.channels_last_3d (3D) according to the 'target' grid dimensions"
+                )
         device = transform.device
         sampler = SampleImage(
             target=transform.grid(),
@@ -163,15 +367,36 @@ class ImageTransformer(SpatialTransformer):
         self._sample = sampler.to(device)
         self._target_grid = target
         self._flip_coords = bool(flip_coords)
-        x = target.coords(align_corners=transform.align_corners(), flip=flip_coords, device=device)
-        x = target.transform_points(x, axes=transform.axes(), to_grid=transform.grid())
-        self.register_buffer("grid_coords", x.unsqueeze(0), persistent=False)
+        self._precision = precision
+        self._batch_inner = bool(batch_inner)
+        self._tile_size = tile_size
+        self._memory_format = memory_format
+        grid_coords = _cached_grid_coords(target, transform, flip_coords, device)
+        self._grid_dtype = grid_coords.dtype
+        self._grid_scale: Optional[float] = None
+        if quantize_coords:
+            scale = max(float(grid_coords.abs().max()), 1.0) / 32767
+            grid_coords = grid_coords.div(scale).round_().to(torch.int16)
+            self._grid_scale = scale
+        self.register_buffer("grid_coords", grid_coords, persistent=False)
+        shift_padding_modes = (PaddingMode.BORDER, PaddingMode.CONSTANT, PaddingMode.ZEROS)
+        self._shift_sampling = (
+            sampler.sampling() is Sampling.LINEAR
+            and sampler.padding_mode() in shift_padding_modes
+            and target == transform.grid()
+            and source == transform.grid()
+        )
 
     @property
     def sample(self) -> SampleImage:
         r"""Source image sampler."""
         return self._sample
 
+    @property
+    def flip_coords(self) -> bool:
+        r"""Whether spatial transformation applies to grid point coordinates in the order (z, y, x)."""
+        return self._flip_coords
+
     def target_grid(self) -> Grid:
         r"""Sampling grid of output images."""
         return self._target_grid
@@ -184,6 +409,37 @@ class ImageTransformer(SpatialTransformer):
         r"""Whether grid center points are implicitly aligned."""
         return self._sample.align_centers()
 
+    def _uniform_shift(
+        self, data: Tensor, transform: Optional[SpatialTransform] = None, update: bool = True
+    ) -> Optional[Tensor]:
+        r"""Get translation offset by which to shift input ``data``, or ``None`` if not applicable.
+
+        Args:
+            data: Input image batch tensor.
+            transform: Spatial transform. Use ``self.transform`` if ``None``.
+            update: Whether to call :meth:`.SpatialTransform.update` before querying the offset.
+                Set to ``False`` if the caller already updated the spatial transform.
+
+        """
+        if not self._shift_sampling:
+            return None
+        if data.ndim != self._target_grid.ndim + 2 or not data.is_floating_point():
+            return None
+        if data.shape[2:] != self._target_grid.shape:
+            return None
+        if transform is None:
+            transform = self._transform
+        if not transform.linear or not _has_only_update_hook(transform):
+            return None
+        if update and transform._update_hook_handle is not None:
+            transform.update()
+        offset = transform.is_uniform_shift()
+        if offset is None or offset.shape[0] != 1:
+            return None
+        if self._flip_coords:
+            offset = offset.flip((-1,))
+        return offset
+
     @overload
     def forward(self, data: Tensor) -> Tensor:
         r"""Sample batch of images at spatially transformed target grid points."""
@@ -205,11 +461,127 @@ class ImageTransformer(SpatialTransformer):
         mask: Optional[Tensor] = None,
     ) -> Union[Tensor, Tuple[Tensor, Tensor], Dict[str, Union[Tensor, Grid]]]:
         r"""Sample batch of images at spatially transformed target grid points."""
-        grid: Tensor = self.grid_coords
-        grid = self._transform(grid, grid=True)
-        if self._flip_coords:
-            grid = grid.flip((-1,))
-        return self._sample(grid, data, mask)
+        # Look up submodules only once, as each access goes through Module.__getattr__()
+        transform = self._transform
+        sampler = self._sample
+        # Invoke spatial transform directly when it is not needed to trigger any other hooks
+        direct = _has_only_update_hook(transform)
+        if direct and transform._update_hook_handle is not None:
+            transform.update()
+        if self._memory_format is not None and isinstance(data, Tensor):
+            if data.ndim == self._target_grid.ndim + 2:
+                data = data.contiguous(memory_format=self._memory_format)
+        if mask is None and isinstance(data, Tensor):
+            offset = self._uniform_shift(data, transform, update=False) if direct else None
+            if offset is not None:
+                return U.grid_sample_shift(
+                    data,
+                    offset,
+                    padding=sampler.padding(),
+                    align_corners=sampler.align_corners(),
+                )
+            if self._tile_size is not None and (
+                transform.linear or transform.grid() == self._target_grid
+            ):
+                return self._forward_tiles(data, transform, sampler, updated=direct)
+        grid = self._target_points(self.grid_coords)
+        if direct and transform.linear:
+            matrix = transform.tensor().to(grid.device)
+            with _float32_matmul_precision(self._precision):
+                return self._sample_points(sampler, grid, data, mask, transform=matrix)
+        apply_transform = transform.forward if direct else transform
+        with _float32_matmul_precision(self._precision):
+            grid = apply_transform(grid, grid=True)
+        return self._sample_points(sampler, grid, data, mask)
+
+    def _target_points(
+        self, grid_coords: Tensor, index: Optional[Tuple[slice, ...]] = None
+    ) -> Tensor:
+        r"""Get undeformed target grid points, optionally only those of a given grid tile."""
+        grid = grid_coords
+        if index is not None:
+            grid = grid[(slice(None),) + index]
+        if self._grid_scale is not None:
+            grid = grid.to(self._grid_dtype).mul_(self._grid_scale)
+        return grid
+
+    def _sample_points(
+        self,
+        sampler: SampleImage,
+        grid: Tensor,
+        data: Union[Tensor, Dict[str, Union[Tensor, Grid]]],
+        mask: Optional[Tensor] = None,
+        transform: Optional[Tensor] = None,
+    ) -> Union[Tensor, Tuple[Tensor, Tensor], Dict[str, Union[Tensor, Grid]]]:
+        r"""Sample images at spatially transformed target grid points.
+
+        When a batch of homogeneous coordinate transformations is given as ``transform`` tensor,
+        the ``grid`` points are those of the undeformed target grid, and the linear transformation
+        is composed with the target to source mapping of the image sampler.
+
+        """
+        if (
+            self._batch_inner
+            and mask is None
+            and isinstance(data, Tensor)
+            and data.ndim == grid.ndim
+            and data.shape[0] > 1
+            and grid.shape[0] == 1
+            and (transform is None or transform.shape[0] == 1)
+        ):
+            shape = data.shape
+            input = data.reshape(1, shape[0] * shape[1], *shape[2:])
+            output = sampler(grid, input, flip_coords=self._flip_coords, transform=transform)
+            output = output.reshape(shape[0], shape[1], *output.shape[2:])
+            if data.is_floating_point():
+                output = output.type_as(data)
+            return output
+        return sampler(grid, data, mask=mask, flip_coords=self._flip_coords, transform=transform)
+
+    def _forward_tiles(
+        self,
+        data: Tensor,
+        transform: SpatialTransform,
+        sampler: SampleImage,
+        updated: bool = False,
+    ) -> Tensor:
+        r"""Sample image at spatially transformed target grid points tile by tile.
+
+        Args:
+            data: Input image batch tensor.
+            transform: Spatial transform.
+            sampler: Image sampler.
+            updated: Whether :meth:`.SpatialTransform.update` was already called by the caller.
+                In this case, the spatial ``transform`` must have no other hooks than the update hook.
+
+        """
+        if updated:
+            apply_transform = transform.forward
+        elif _has_only_update_hook(transform):
+            if transform._update_hook_handle is not None:
+                transform.update()
+            apply_transform = transform.forward
+        else:
+            apply_transform = transform
+        shape = self._target_grid.shape
+        tile_shape = tuple(reversed(self._tile_size))
+        ranges = [range(0, n, m) for n, m in zip(shape, tile_shape)]
+        grid_coords = self.grid_coords
+        output: Optional[Tensor] = None
+        for start in itertools.product(*ranges):
+            index = tuple(slice(i, i + m) for i, m in zip(start, tile_shape))
+            grid = self._target_points(grid_coords, index)
+            with _float32_matmul_precision(self._precision):
+                grid = apply_transform(grid, grid=False)
+            tile = self._sample_points(sampler, grid, data)
+            assert isinstance(tile, Tensor)
+            if output is None:
+                output = tile.new_empty(tile.shape[: tile.ndim - len(shape)] + shape)
+            output[(Ellipsis,) + index] = tile
+        assert output is not None
+        if data.is_floating_point():
+            output = output.type_as(data)
+        return output
 
 
 class PointSetTransformer(SpatialTransformer):
@@ -228,6 +600,9 @@ class PointSetTransformer(SpatialTransformer):
 
     """
 
+    pre_matrix: Tensor
+    post_matrix: Tensor
+
     def __init__(
         self,
         transform: SpatialTransform,
@@ -263,6 +638,18 @@ class PointSetTransformer(SpatialTransformer):
         self._axes = axes
         self._to_grid = to_grid
         self._to_axes = to_axes
+        self._set_domain_matrices(transform)
+
+    def _set_domain_matrices(self, transform: SpatialTransform) -> None:
+        r"""Precompute linear maps between target, spatial transform, and source domains."""
+        device = transform.device
+        grid = transform.grid()
+        axes = transform.axes()
+        pre_matrix = grid_points_transform(self._grid, self._axes, grid, axes)
+        post_matrix = grid_points_transform(grid, axes, self._to_grid, self._to_axes)
+        self.register_buffer("pre_matrix", pre_matrix.to(device), persistent=False)
+        self.register_buffer("post_matrix", post_matrix.to(device), persistent=False)
+        self._transform_grid = grid
 
     def target_axes(self) -> Axes:
         r"""Coordinate axes with respect to which input points are defined."""
@@ -281,21 +668,28 @@ class PointSetTransformer(SpatialTransformer):
         return self._to_grid
 
     def forward(self, points: Tensor) -> Tensor:
-        r"""Spatially transform a set of points."""
-        transform = self.transform
-        points = self._grid.transform_points(
-            points,
-            axes=self._axes,
-            to_grid=transform.grid(),
-            to_axes=transform.axes(),
-            decimals=None,
-        )
+        r"""Spatially transform a set of points.
+
+        The linear maps from the target domain to the domain of the spatial transform, and from this
+        domain to the source domain, are applied with a single matrix multiplication each. These maps
+        are precomputed, and only updated when the grid of the spatial transform has been replaced.
+        When the spatial transform is linear and no other module hooks than the update hook are
+        registered, all three transformations are composed first, and the points are transformed once.
+
+        """
+        transform = self._transform
+        if transform.grid() is not self._transform_grid:
+            self._set_domain_matrices(transform)
+        pre_matrix = self.pre_matrix
+        post_matrix = self.post_matrix
+        if transform.linear and _has_only_update_hook(transform):
+            if transform._update_hook_handle is not None:
+                transform.update()
+            matrix = transform.tensor()
+            device = matrix.device
+            matrix = homogeneous_matmul(post_matrix.to(device), matrix, pre_matrix.to(device))
+            return homogeneous_transform(matrix.to(points.device), points)
+        points = homogeneous_transform(pre_matrix.to(points.device), points)
         points = transform(points)
-        points = transform.grid().transform_points(
-            points,
-            axes=transform.axes(),
-            to_grid=self._to_grid,
-            to_axes=self._to_axes,
-            decimals=None,
-        )
+        points = homogeneous_transform(post_matrix.to(points.device), points)
         return points
@@ -194,3 +194,32 @@ def test_sample_image() -> None:
     result = U.sample_image(image, coords, mode="nearest")
     expected = image.flatten(2).index_select(2, indices)
     assert result.eq(expected).all()
+
+
+def test_grid_sample_shift() -> None:
+    generator = torch.Generator().manual_seed(123456789)
+    for shape in ((2, 3, 9, 11), (1, 2, 7, 9, 11)):
+        data = torch.rand(shape, generator=generator)
+        grid = Grid(shape=shape[2:])
+        D = grid.ndim
+        offsets = [
+            torch.rand((D,), generator=generator).sub_(0.5).mul_(0.5),
+            torch.rand((1, D), generator=generator).sub_(0.5).mul_(3),
+            torch.tensor([2.5, -3.25, 4.0][:D]),
+        ]
+        for align_corners in (False, True):
+            coords = grid.coords(align_corners=align_corners).unsqueeze(0)
+            for padding in ("border", "zeros", 0.5):
+                for offset in offsets:
+                    result = U.grid_sample_shift(
+                        data, offset, padding=padding, align_corners=align_corners
+                    )
+                    expected = U.grid_sample(
+                        data,
+                        coords + offset.reshape(1, *([1] * D), D),
+                        mode="linear",
+                        padding=padding,
+                        align_corners=align_corners,
+                    )
+                    assert result.shape == data.shape
+                    assert torch.allclose(result, expected, atol=1e-5)
@@ -1,9 +1,25 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import pytest
 import torch
 
 from deepali.core import functional as U
+from deepali.core import Grid
 from deepali.data import ImageBatch
-from deepali.spatial import Translation
-from deepali.spatial import ImageTransformer
+from deepali.spatial import AffineTransform, DisplacementFieldTransform, Translation
+from deepali.spatial import ImageTransformer, PointSetTransformer
+
+
+def random_affine_transform(
+    grid: Grid, generator: torch.Generator, groups: int = 1
+) -> AffineTransform:
+    r"""Create affine transformation with small random parameters."""
+    transform = AffineTransform(grid, groups=groups)
+    with torch.no_grad():
+        for param in transform.parameters():
+            param.uniform_(-0.1, 0.1, generator=generator)
+    return transform
 
 
 def test_spatial_image_transformer() -> None:
@@ -50,3 +66,285 @@ def test_spatial_image_transformer() -> None:
     warped = transformer.forward(image)
     expected = U.cshape_image(size=(65, 33), center=(32 - 16, 16), sigma=1, dtype=image.dtype)
     assert torch.allclose(warped, expected)
+
+
+def test_spatial_image_transformer_flip_coords() -> None:
+    image = ImageBatch(U.cshape_image(size=(65, 33), center=(32, 16), sigma=1, dtype=torch.float32))
+    mask = image.tensor() > 0.5
+    source = image.grid().center(8, 4).spacing(1.5, 1)
+
+    offset = torch.tensor([0.25, -0.125], dtype=torch.float32)
+    translation = Translation(image.grid(), params=offset.unsqueeze(0))
+    transformer = ImageTransformer(translation, source=source)
+    expected_data, expected_mask = transformer.forward(image, mask)
+
+    # Transform (z, y, x) ordered grid point coordinates by translation with flipped offset
+    translation = Translation(image.grid(), params=offset.flip(0).unsqueeze(0))
+    transformer = ImageTransformer(translation, source=source, flip_coords=True)
+    assert transformer.flip_coords
+    warped_data, warped_mask = transformer.forward(image, mask)
+    assert torch.allclose(warped_data, expected_data, atol=1e-6)
+    assert warped_mask.eq(expected_mask).all()
+
+    # Image sampler of transformer maps grid points with coordinates in the order (x, y)
+    points = image.grid().points().unsqueeze(0)
+    expected_data = ImageTransformer(translation, source=source).sample(points, image)
+    assert torch.allclose(transformer.sample(points, image), expected_data)
+
+
+def test_spatial_image_transformer_shift() -> None:
+    generator = torch.Generator().manual_seed(123456789)
+    data = torch.rand((2, 3, 7, 9, 11), generator=generator)
+    image = ImageBatch(data)
+    for padding in ("border", "zeros", 0.5):
+        offset = torch.rand((1, 3), generator=generator).sub_(0.5).mul_(3)
+        translation = Translation(image.grid(), params=offset)
+        transformer = ImageTransformer(translation, padding=padding)
+        assert transformer._uniform_shift(data) is not None
+        warped = transformer.forward(data)
+        # Register hook which disables uniform shift and samples image at transformed grid points
+        translation.register_forward_hook(lambda *args: None)
+        assert transformer._uniform_shift(data) is None
+        expected = transformer.forward(data)
+        assert torch.allclose(warped, expected, atol=1e-5)
+    # Output of shift path has same type as output of image sampler
+    translation = Translation(image.grid(), params=torch.tensor([[0.25, -0.5, 0.125]]))
+    transformer = ImageTransformer(translation)
+    assert transformer._uniform_shift(image) is not None
+    warped = transformer.forward(image)
+    assert type(warped) is ImageBatch
+    assert warped.grid() == image.grid()
+    # Input image is resampled on target grid when its size differs
+    data = torch.rand((1, 1, 14, 18, 22), generator=generator)
+    assert transformer._uniform_shift(data) is None
+    warped = transformer.forward(data)
+    assert warped.shape == (1, 1) + image.grid().shape
+
+
+def test_spatial_image_transformer_linear() -> None:
+    generator = torch.Generator().manual_seed(123456789)
+    data = torch.rand((2, 1, 9, 11), generator=generator)
+    mask = data > 0.5
+    grid = Grid(shape=data.shape[2:])
+    source = grid.center(1, -2).spacing(1.2, 0.8)
+    transform = random_affine_transform(grid, generator, groups=2)
+    for flip_coords in (False, True):
+        transformer = ImageTransformer(transform, source=source, flip_coords=flip_coords)
+        warped_data, warped_mask = transformer.forward(data, mask)
+        # Register hook which disables composition of linear transformations
+        handle = transform.register_forward_hook(lambda *args: None)
+        expected_data, expected_mask = transformer.forward(data, mask)
+        handle.remove()
+        assert torch.allclose(warped_data, expected_data, atol=1e-5)
+        assert warped_mask.eq(expected_mask).all()
+
+
+def test_spatial_transformer_backward_hook() -> None:
+    data = torch.rand((1, 1, 7, 9), generator=torch.Generator().manual_seed(123456789))
+    grid = Grid(shape=data.shape[2:])
+    points = grid.points().unsqueeze(0)
+    for transform in (Translation(grid), AffineTransform(grid)):
+        calls = []
+        transform.register_full_backward_hook(lambda *args: calls.append(args))
+        ImageTransformer(transform).forward(data).sum().backward()
+        assert len(calls) == 1
+        PointSetTransformer(transform).forward(points).sum().backward()
+        assert len(calls) == 2
+
+
+def test_spatial_transformer_global_hooks() -> None:
+    data = torch.rand((1, 1, 7, 9), generator=torch.Generator().manual_seed(123456789))
+    grid = Grid(shape=data.shape[2:])
+    points = grid.points().unsqueeze(0)
+    for transform in (Translation(grid), AffineTransform(grid)):
+        modules = []
+        handle = torch.nn.modules.module.register_module_forward_hook(
+            lambda module, *args: modules.append(module)
+        )
+        try:
+            ImageTransformer(transform).forward(data)
+            assert transform in modules
+            modules.clear()
+            PointSetTransformer(transform).forward(points)
+            assert transform in modules
+        finally:
+            handle.remove()
+
+
+def test_spatial_image_transformer_update() -> None:
+    data = torch.rand((1, 1, 7, 9), generator=torch.Generator().manual_seed(123456789))
+    grid = Grid(shape=data.shape[2:])
+    transforms = (Translation(grid), AffineTransform(grid), DisplacementFieldTransform(grid))
+    for transform in transforms:
+        for tile_size in (None, 4):
+            transformer = ImageTransformer(transform, tile_size=tile_size)
+            with patch.object(transform, "update", wraps=transform.update) as update:
+                transformer.forward(data)
+                assert update.call_count == 1
+
+
+@pytest.mark.skipif(
+    not hasattr(torch, "set_float32_matmul_precision"), reason="requires torch>=1.12"
+)
+def test_spatial_image_transformer_precision() -> None:
+    generator = torch.Generator().manual_seed(123456789)
+    data = torch.rand((1, 1, 9, 11), generator=generator)
+    grid = Grid(shape=data.shape[2:])
+    transform = random_affine_transform(grid, generator)
+    with pytest.raises(ValueError):
+        ImageTransformer(transform, precision="low")
+    precision = torch.get_float32_matmul_precision()
+    assert precision != "medium"
+    expected = ImageTransformer(transform).forward(data)
+    transformer = ImageTransformer(transform, precision="medium")
+    warped = transformer.forward(data)
+    assert torch.allclose(warped, expected, atol=1e-2)
+    assert torch.get_float32_matmul_precision() == precision
+    # Restore precision when spatial transform raises an exception
+    precisions = []
+
+    def hook(*args) -> None:
+        precisions.append(torch.get_float32_matmul_precision())
+        raise RuntimeError("hook")
+
+    handle = transform.register_forward_hook(hook)
+    with pytest.raises(RuntimeError, match="hook"):
+        transformer.forward(data)
+    handle.remove()
+    assert precisions == ["medium"]
+    assert torch.get_float32_matmul_precision() == precision
+    # Restore precision when forward passes run concurrently in multiple threads
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        for _ in executor.map(lambda _: transformer.forward(data), range(32)):
+            pass
+    assert torch.get_float32_matmul_precision() == precision
+
+
+def test_spatial_image_transformer_grid_coords() -> None:
+    grid = Grid(size=(33, 17))
+    transformer1 = ImageTransformer(Translation(grid))
+    transformer2 = ImageTransformer(Translation(grid.clone()))
+    assert transformer1.grid_coords is transformer2.grid_coords
+    transformer3 = ImageTransformer(Translation(grid), flip_coords=True)
+    assert transformer3.grid_coords is not transformer1.grid_coords
+    assert torch.equal(transformer3.grid_coords, transformer1.grid_coords.flip((-1,)))
+    transformer4 = ImageTransformer(Translation(grid), target=grid.center(1, 1))
+    assert transformer4.grid_coords is not transformer1.grid_coords
+
+
+def test_spatial_image_transformer_grid_coords_inference_mode() -> None:
+    data = torch.rand((1, 1, 9, 11), generator=torch.Generator().manual_seed(123456789))
+    grid = Grid(shape=data.shape[2:])
+    with torch.inference_mode():
+        transformer = ImageTransformer(AffineTransform(grid))
+        assert transformer.grid_coords.is_inference()
+        transformer.forward(data)
+    transformer = ImageTransformer(AffineTransform(grid))
+    assert not transformer.grid_coords.is_inference()
+    transformer.forward(data).sum().backward()
+
+
+def test_spatial_image_transformer_batch_inner() -> None:
+    generator = torch.Generator().manual_seed(123456789)
+    data = torch.rand((4, 2, 9, 11), generator=generator)
+    grid = Grid(shape=data.shape[2:])
+    transform = random_affine_transform(grid, generator)
+    expected = ImageTransformer(transform).forward(data)
+    transformer = ImageTransformer(transform, batch_inner=True)
+    shapes = []
+    transformer.sample.register_forward_pre_hook(lambda _, args: shapes.append(args[1].shape))
+    warped = transformer.forward(data)
+    assert shapes == [(1, 8, 9, 11)]
+    assert warped.shape == data.shape
+    assert torch.allclose(warped, expected, atol=1e-6)
+    # Output has same type as without folding batch into channels
+    image = ImageBatch(data)
+    warped = transformer.forward(image)
+    assert len(shapes) == 2
+    assert type(warped) is ImageBatch
+    assert warped.grids() == image.grids()
+
+
+def test_spatial_transformer_condition() -> None:
+    grid = Grid(size=(9, 7))
+    data = torch.zeros((1, 1, 7, 9))
+    transformer = ImageTransformer(Translation(grid))
+    conditioned = transformer.condition(data)
+    assert type(conditioned) is ImageTransformer
+    assert conditioned is not transformer
+    assert conditioned.transform is not transformer.transform
+    assert conditioned.condition()[0][0] is data
+    assert transformer.condition() == ((), {})
+    assert conditioned.grid_coords is transformer.grid_coords
+    assert conditioned.sample is transformer.sample
+    assert conditioned.forward(data).shape == data.shape
+
+
+def test_spatial_point_set_transformer() -> None:
+    generator = torch.Generator().manual_seed(123456789)
+    grid = Grid(size=(33, 17), spacing=(0.5, 1))
+    to_grid = Grid(size=(21, 27), spacing=(0.8, 0.6), center=(1, -2))
+    transform = random_affine_transform(grid, generator)
+    points = torch.rand((1, 10, 2), generator=generator).mul_(16)
+    expected = transform.points(points, grid=grid, axes="grid", to_grid=to_grid, to_axes="world")
+    transformer = PointSetTransformer(
+        transform, grid=grid, axes="grid", to_grid=to_grid, to_axes="world"
+    )
+    assert torch.allclose(transformer.forward(points), expected, atol=1e-4)
+    # Register hook which disables composition of linear transformations
+    transform.register_forward_hook(lambda *args: None)
+    assert torch.allclose(transformer.forward(points), expected, atol=1e-4)
+    # Linear maps between domains are updated when grid of spatial transform is replaced
+    transform.grid_(grid.center(2, 1))
+    expected = transform.points(points, grid=grid, axes="grid", to_grid=to_grid, to_axes="world")
+    assert torch.allclose(transformer.forward(points), expected, atol=1e-4)
+
+
+def test_spatial_image_transformer_quantize_coords() -> None:
+    image = ImageBatch(U.cshape_image(size=(65, 33), center=(32, 16), sigma=1, dtype=torch.float32))
+    transform = random_affine_transform(image.grid(), torch.Generator().manual_seed(123456789))
+    transformer = ImageTransformer(transform, quantize_coords=True)
+    assert transformer.grid_coords.dtype == torch.int16
+    warped = transformer.forward(image)
+    expected = ImageTransformer(transform).forward(image)
+    assert torch.allclose(warped, expected, atol=1e-3)
+
+
+def test_spatial_image_transformer_tile_size() -> None:
+    generator = torch.Generator().manual_seed(123456789)
+    data = torch.rand((2, 3, 7, 9, 11), generator=generator)
+    grid = Grid(shape=data.shape[2:])
+    transform = random_affine_transform(grid, generator)
+    expected = ImageTransformer(transform).forward(data)
+    warped = ImageTransformer(transform, tile_size=(4, 5, 3)).forward(data)
+    assert warped.shape == expected.shape
+    assert torch.allclose(warped, expected, atol=1e-6)
+    # Output has same type as without tiling
+    image = ImageBatch(data)
+    warped = ImageTransformer(transform, tile_size=(4, 5, 3)).forward(image)
+    assert type(warped) is ImageBatch
+    assert warped.grid() == image.grid()
+    # Displacements of non-rigid transformation are resized to target grid as without tiling
+    for transform_grid, target in ((grid, grid), (Grid(size=(6, 5, 4)), Grid(size=(13, 11, 9)))):
+        transform = DisplacementFieldTransform(transform_grid)
+        with torch.no_grad():
+            transform.params.uniform_(-0.1, 0.1, generator=generator)
+        expected = ImageTransformer(transform, target=target).forward(data)
+        warped = ImageTransformer(transform, target=target, tile_size=(4, 5, 3)).forward(data)
+        assert warped.shape == expected.shape
+        assert torch.allclose(warped, expected, atol=1e-6)
+
+
+def test_spatial_image_transformer_memory_format() -> None:
+    generator = torch.Generator().manual_seed(123456789)
+    data = torch.rand((2, 3, 9, 11), generator=generator)
+    grid = Grid(shape=data.shape[2:])
+    transform = random_affine_transform(grid, generator)
+    expected = ImageTransformer(transform).forward(data)
+    transformer = ImageTransformer(transform, memory_format=torch.channels_last)
+    inputs = []
+    transformer.sample.register_forward_pre_hook(lambda _, args: inputs.append(args[1]))
+    warped = transformer.forward(data)
+    assert len(inputs) == 1
+    assert inputs[0].is_contiguous(memory_format=torch.channels_last)
+    assert torch.allclose(warped, expected, atol=1e-6)